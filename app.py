@@ -51,6 +51,11 @@ def create_app():
         "last_updated": None,
     }
 
+    # Replay any pending purchase journal and start background compaction
+    import utils
+
+    utils.start_journal_worker(app.logger)
+
     # Register API routes
     from routes import register_routes
 
@@ -1,15 +1,33 @@
+import fcntl
 import json
 import os
+import threading
+import time
 import uuid
+from contextlib import contextmanager
 from datetime import datetime
 
-# File to store purchases
+# File to store purchases (snapshot) and the append-only journal of changes
 DATA_DIR = "data"
 PURCHASES_FILE = os.path.join(DATA_DIR, "purchases.json")
+JOURNAL_FILE = os.path.join(DATA_DIR, "purchases.journal")
+LOCK_FILE = os.path.join(DATA_DIR, "purchases.lock")
+
+# Journal tuning (fsync batching and background compaction)
+JOURNAL_FSYNC_BATCH = int(os.environ.get("JOURNAL_FSYNC_BATCH", 16))
+JOURNAL_FSYNC_INTERVAL = float(os.environ.get("JOURNAL_FSYNC_INTERVAL", 1.0))
+JOURNAL_COMPACT_INTERVAL = float(os.environ.get("JOURNAL_COMPACT_INTERVAL", 300))
+JOURNAL_COMPACT_BYTES = int(os.environ.get("JOURNAL_COMPACT_BYTES", 1024 * 1024))
 
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Per-process journal state, guarded by _journal_lock
+_journal_lock = threading.Lock()
+_journal_fd = None
+_pending_syncs = 0
+_journal_worker = None
+
 
 def generate_id():
     """Generate a unique ID for a purchase"""
@@ -45,8 +63,24 @@ def calculate_profit_loss(purchase_price, current_price, grams):
     }
 
 
-def get_all_purchases():
-    """Get all purchases from storage"""
+@contextmanager
+def _storage_lock(operation):
+    """
+    Hold a cross-process lock on the purchase storage
+
+    Appends and reads take a shared lock; compaction takes an exclusive
+    lock so that no record is written while the journal is being folded.
+    """
+    with open(LOCK_FILE, "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _read_snapshot():
+    """Read the purchases snapshot"""
     if not os.path.exists(PURCHASES_FILE):
         return []
 
@@ -57,29 +91,182 @@ def get_all_purchases():
         return []
 
 
-def save_purchases(purchases):
-    """Save purchases to storage"""
-    with open(PURCHASES_FILE, "w") as f:
+def _write_snapshot(purchases):
+    """Atomically replace the purchases snapshot"""
+    tmp_file = PURCHASES_FILE + ".tmp"
+    with open(tmp_file, "w") as f:
         json.dump(purchases, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, PURCHASES_FILE)
+
+    # Make the rename itself durable
+    dir_fd = os.open(DATA_DIR, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def _replay():
+    """
+    Rebuild the purchase list from the snapshot plus the journal
+
+    Replaying is idempotent (adds are keyed by ID), so a journal that was
+    already folded into the snapshot can safely be applied again. A torn
+    record left by a crash mid-write is skipped.
+    """
+    purchases = {}
+    for index, purchase in enumerate(_read_snapshot()):
+        purchases[purchase.get("id") or f"_{index}"] = purchase
+
+    if os.path.exists(JOURNAL_FILE):
+        with open(JOURNAL_FILE, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                if record.get("op") == "add":
+                    purchase = record["purchase"]
+                    purchases[purchase.get("id")] = purchase
+                elif record.get("op") == "delete":
+                    purchases.pop(record.get("id"), None)
+
+    return list(purchases.values())
+
+
+def _open_journal():
+    """Open the journal for appending, terminating any torn last record"""
+    fd = os.open(JOURNAL_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    with open(JOURNAL_FILE, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                os.write(fd, b"\n")
+    return fd
+
+
+def _append_record(record):
+    """Append a single record to the journal, fsyncing in batches"""
+    global _journal_fd, _pending_syncs
+
+    line = (json.dumps(record) + "\n").encode("utf-8")
+    with _journal_lock, _storage_lock(fcntl.LOCK_SH):
+        if _journal_fd is None:
+            _journal_fd = _open_journal()
+
+        os.write(_journal_fd, line)
+        _pending_syncs += 1
+        if _pending_syncs >= JOURNAL_FSYNC_BATCH:
+            os.fsync(_journal_fd)
+            _pending_syncs = 0
+
+
+def sync_journal():
+    """Flush any journal records written since the last fsync"""
+    global _pending_syncs
+
+    with _journal_lock:
+        if _journal_fd is not None and _pending_syncs:
+            os.fsync(_journal_fd)
+            _pending_syncs = 0
+
+
+def compact_journal():
+    """
+    Fold the journal into the purchases snapshot
+
+    Returns:
+        bool: True if there was anything to compact
+    """
+    global _pending_syncs
+
+    with _journal_lock, _storage_lock(fcntl.LOCK_EX):
+        if not os.path.exists(JOURNAL_FILE) or os.path.getsize(JOURNAL_FILE) == 0:
+            return False
+
+        _write_snapshot(_replay())
+        os.truncate(JOURNAL_FILE, 0)
+        _pending_syncs = 0
+        return True
+
+
+def start_journal_worker(logger):
+    """
+    Recover pending journal records and start the background worker
+
+    The worker fsyncs batched journal writes every JOURNAL_FSYNC_INTERVAL
+    seconds and compacts the journal every JOURNAL_COMPACT_INTERVAL seconds,
+    or sooner once it grows beyond JOURNAL_COMPACT_BYTES.
+
+    Args:
+        logger (logging.Logger): Logger used to report worker errors
+    """
+    global _journal_worker
+
+    if compact_journal():
+        logger.info("Recovered purchases journal into snapshot")
+
+    if _journal_worker is not None:
+        return
+
+    def run():
+        last_compaction = time.monotonic()
+        while True:
+            time.sleep(JOURNAL_FSYNC_INTERVAL)
+            try:
+                sync_journal()
+
+                elapsed = time.monotonic() - last_compaction
+                journal_size = (
+                    os.path.getsize(JOURNAL_FILE) if os.path.exists(JOURNAL_FILE) else 0
+                )
+                if (
+                    elapsed >= JOURNAL_COMPACT_INTERVAL
+                    or journal_size >= JOURNAL_COMPACT_BYTES
+                ):
+                    if compact_journal():
+                        logger.info("Compacted purchases journal")
+                    last_compaction = time.monotonic()
+            except Exception as e:
+                logger.error(f"Error in purchases journal worker: {e}")
+
+    _journal_worker = threading.Thread(
+        target=run, name="purchases-journal", daemon=True
+    )
+    _journal_worker.start()
+
+
+def get_all_purchases():
+    """Get all purchases from storage"""
+    with _storage_lock(fcntl.LOCK_SH):
+        return _replay()
+
+
+def save_purchases(purchases):
+    """Save purchases to storage, replacing the snapshot and clearing the journal"""
+    global _pending_syncs
+
+    with _journal_lock, _storage_lock(fcntl.LOCK_EX):
+        _write_snapshot(purchases)
+        if os.path.exists(JOURNAL_FILE):
+            os.truncate(JOURNAL_FILE, 0)
+        _pending_syncs = 0
 
 
 def add_purchase(purchase):
     """Add a new purchase"""
-    purchases = get_all_purchases()
-    purchases.append(purchase)
-    save_purchases(purchases)
+    _append_record({"op": "add", "purchase": purchase})
     return purchase
 
 
 def delete_purchase(purchase_id):
     """Delete a purchase by ID"""
-    purchases = get_all_purchases()
-    initial_count = len(purchases)
-
-    purchases = [p for p in purchases if p.get("id") != purchase_id]
-
-    if len(purchases) < initial_count:
-        save_purchases(purchases)
-        return True
+    if not any(p.get("id") == purchase_id for p in get_all_purchases()):
+        return False
 
-    return False
+    _append_record({"op": "delete", "id": purchase_id})
+    return True